@@ -12,12 +12,25 @@ async def websocket_endpoint(websocket: WebSocket, mission_id: str):
         if mission_id not in game_sessions:
             session = GameSession(mission_id, manager)
             game_sessions[mission_id] = session
-            await session.start()
+            if not await session.start():
+                # Don't keep a half-built session around for a mission that can't run;
+                # the cleanup below removes it.
+                await websocket.close()
+                return
         else:
             session = game_sessions[mission_id]
 
+        # Push the status on every connect, including reconnects to a running session.
+        if not await session.send_status():
+            # The session has stopped; the cleanup below discards it.
+            await websocket.close()
+            return
+
         while True:
             message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                # receive() reports a disconnect as a message; calling it again would raise.
+                break
             
             if "text" in message:
                 data = json.loads(message["text"])
@@ -43,11 +56,14 @@ async def websocket_endpoint(websocket: WebSocket, mission_id: str):
                         await session.handle_user_dialogue(dialogue_text)
 
     except WebSocketDisconnect:
-        print(f"Client disconnected from mission {mission_id}. Cleaning up session.")
-        if mission_id in game_sessions:
-            session = game_sessions[mission_id]
-            await session.stop()
-            del game_sessions[mission_id]
-        
-        manager.disconnect(mission_id)
-        print(f"Session for mission {mission_id} closed.")
\ No newline at end of file
+        pass
+    finally:
+        # A reconnect replaces this socket in the manager; the session then belongs to the new connection.
+        if manager.active_connections.get(mission_id) is websocket:
+            print(f"Client disconnected from mission {mission_id}. Cleaning up session.")
+            if mission_id in game_sessions:
+                session = game_sessions.pop(mission_id)
+                await session.stop()
+            
+            manager.disconnect(mission_id)
+            print(f"Session for mission {mission_id} closed.")
\ No newline at end of file
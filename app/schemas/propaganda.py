@@ -3,6 +3,8 @@ from typing import List, Optional
 from pydantic_mongo import PydanticObjectId
 from bson import ObjectId
 
+MAX_DIALOGUE_LINES = 7 # Upper bound on the lines in a single dialogue turn
+
 class Speaker(BaseModel):
     """Defines a speaker in the radio show."""
     name: str
@@ -11,13 +13,20 @@ class Speaker(BaseModel):
     background: str
 
 class PropagandaGenerationResult(BaseModel):
-    """Schema for the data directly generated by the LLM in Stage 1."""
+    """Schema for the mission data generated by the LLM, as stored on the mission."""
     topic: str = Field(..., description="The topic of the propaganda. Can be user-defined or generated by the LLM.")
     summary: str
     proof_sentences: List[str] = Field(..., description="A few sentences that serve as 'proof' or talking points.")
     speakers: List[Speaker] = Field(..., min_length=1, max_length=4)
     initial_listeners: int
 
+class MissionGenerationResult(PropagandaGenerationResult):
+    """
+    Schema for the LLM response at mission creation. The briefing is generated in the
+    same call but stored separately, as the mission's `dialogue_generator_prompt`.
+    """
+    briefing: str = Field(..., description="The show & character briefing used to drive dialogue generation.")
+
 class DialogueLine(BaseModel):
     """Represents a single line of dialogue from a speaker."""
     speaker_name: str
@@ -26,9 +35,10 @@ class DialogueLine(BaseModel):
 class DialogueTurn(BaseModel):
     """
     Represents a turn in the conversation, including dialogue and its impact.
-    This is the expected structured response for dialogue generation.
+    This is the expected structured response for dialogue generation; both the
+    dialogue and the listener impact come from the same LLM call.
     """
-    dialogues: List[DialogueLine]
+    dialogues: List[DialogueLine] = Field(..., min_length=1, max_length=MAX_DIALOGUE_LINES)
     awakened_listeners_change: float = Field(..., description="Percentage change in awakened listeners. Can be positive, negative, or zero.")
 
 class UserDialogue(BaseModel):
@@ -42,7 +52,7 @@ class PropagandaMission(BaseModel):
     topic: str
     status: str = "stage1"
     generation_result: PropagandaGenerationResult
-    dialogue_generator_prompt: Optional[str] = None # The dynamic part of the prompt, generated in Stage 2.
+    dialogue_generator_prompt: Optional[str] = None # The dynamic part of the dialogue prompt (the character briefing).
 
 class PropagandaCreateRequest(BaseModel):
     """Request model for creating a new propaganda mission."""
@@ -3,11 +3,22 @@ import json
 from enum import Enum, auto
 from fastapi import WebSocket
 from typing import Dict, List, Optional
-from app.services.llm_service import generate_dialogue
+from app.services.llm_service import (
+    DialogueCacheExpiredError,
+    LLMServiceError,
+    create_dialogue_cache,
+    delete_dialogue_cache,
+    generate_dialogue,
+)
 from app.services.deepgram_service import deepgram_service
 from app.db.propaganda_db import get_propaganda_mission_by_id
 from app.db.mongodb_utils import get_database
-from app.schemas.propaganda import DialogueLine, Speaker
+from app.schemas.propaganda import DialogueLine, DialogueTurn, Speaker
+
+# Retry policy for failed dialogue generations (seconds / attempts)
+GENERATION_RETRY_BASE_DELAY = 1.0
+GENERATION_RETRY_MAX_DELAY = 30.0
+MAX_GENERATION_FAILURES = 5
 
 class ConnectionManager:
     """Manages active WebSocket connections."""
@@ -26,6 +37,11 @@ class ConnectionManager:
         if mission_id in self.active_connections:
             await self.active_connections[mission_id].send_text(message)
 
+    async def close(self, mission_id: str, code: int = 1011):
+        """Closes the client's socket; the endpoint then tears the session down."""
+        if mission_id in self.active_connections:
+            await self.active_connections[mission_id].close(code=code)
+
 class SessionState(Enum):
     IDLE = auto()
     SPEAKING_TTS = auto()
@@ -44,8 +60,11 @@ class GameSession:
         self.dialogue_history = ""
         self.mission_context = ""
         self.proof_sentences: List[str] = []
+        self.dialogue_cache_name: Optional[str] = None # Context cache for the static part of the dialogue prompt
         self.initial_listeners: int = 0 # New: Store initial listeners
+        self.mission_status: Optional[str] = None # Mission status pushed to clients when they connect
         self._awakened_listeners: float = 0.0 # New: Track awakened listeners
+        self._has_new_user_input = False # Whether the user spoke since the last dialogue generation
         
         self._is_active = True
         self._state = SessionState.IDLE
@@ -53,32 +72,44 @@ class GameSession:
         
         self._main_task: Optional[asyncio.Task] = None
         self._tts_task: Optional[asyncio.Task] = None
+        self._generation_task: Optional[asyncio.Task] = None # Streams LLM dialogue into the queue
+        self._generation_failures = 0 # Consecutive failed generations
+        self._next_generation_at = 0.0 # Event loop time before which no new generation is started
         self._listener_broadcast_task: Optional[asyncio.Task] = None # New: Task for broadcasting listeners
+        self._cache_task: Optional[asyncio.Task] = None # Creates the dialogue cache without delaying the first turn
         
         self._live_transcriber = deepgram_service.get_live_transcriber()
 
-    async def start(self):
+    async def start(self) -> bool:
+        """
+        Loads the mission and starts the session loops.
+        Returns False if the mission does not exist or has no dialogue prompt yet
+        (e.g. missions created before the briefing was generated at creation time).
+        """
         print(f"Game session starting for mission {self.mission_id}")
         db = await get_database()
         mission = await get_propaganda_mission_by_id(self.mission_id, db)
         if not mission or not mission.dialogue_generator_prompt:
             await self.manager.send_to_client(json.dumps({"error": "Mission not ready."}), self.mission_id)
-            return
+            return False
         
         self.speakers = mission.generation_result.speakers
         self.mission_context = mission.dialogue_generator_prompt
         self.proof_sentences = mission.generation_result.proof_sentences
         self.initial_listeners = mission.generation_result.initial_listeners # New: Set initial listeners
+        self.mission_status = mission.status
         self._awakened_listeners = 0.0 # Initialize awakened listeners to 0 at start
-        
+
+        self._cache_task = asyncio.create_task(self._create_dialogue_cache())
         self._main_task = asyncio.create_task(self._main_loop())
         self._listener_broadcast_task = asyncio.create_task(self._broadcast_listeners_loop()) # New: Start broadcast task
+        return True
 
     async def stop(self):
         print(f"Stopping game session for mission {self.mission_id}")
         self._is_active = False
         
-        tasks_to_cancel = [self._main_task, self._tts_task, self._listener_broadcast_task] # New: Add broadcast task to cancel list
+        tasks_to_cancel = [self._main_task, self._tts_task, self._generation_task, self._listener_broadcast_task] # New: Add broadcast task to cancel list
         for task in tasks_to_cancel:
             if task and not task.done():
                 task.cancel()
@@ -89,9 +120,49 @@ class GameSession:
         
         if self._live_transcriber._is_active:
             await self._live_transcriber.stop()
+
+        # Let an in-flight cache creation finish rather than cancel it, so the
+        # cache it creates is not left behind undeleted.
+        if self._cache_task:
+            await self._cache_task
+
+        if self.dialogue_cache_name:
+            try:
+                await delete_dialogue_cache(self.dialogue_cache_name)
+            except LLMServiceError as e:
+                print(f"Error deleting dialogue cache: {e}")
+            self.dialogue_cache_name = None
             
         print("Game session tasks cancelled successfully.")
 
+    async def _create_dialogue_cache(self):
+        """
+        Caches the static dialogue prompt in the background. Turns generated before
+        it is ready send the full prompt; later turns use the cache.
+        """
+        try:
+            self.dialogue_cache_name = await create_dialogue_cache(self.mission_context, self.proof_sentences)
+            print(f"[GameSession] Created dialogue cache: {self.dialogue_cache_name}")
+        except LLMServiceError as e:
+            # Caching is an optimisation only; fall back to sending the full prompt each turn.
+            print(f"[GameSession] Dialogue cache unavailable, sending full prompt per turn: {e}")
+
+    @property
+    def is_running(self) -> bool:
+        """Whether the dialogue loop is still running and the session can serve a client."""
+        return self._is_active and self._main_task is not None and not self._main_task.done()
+
+    async def send_status(self) -> bool:
+        """
+        Tells the connected client whether the session is ready, so it never has to poll
+        for the status. Returns False (after sending an error) if the session has stopped.
+        """
+        if not self.is_running:
+            await self.manager.send_to_client(json.dumps({"error": "Dialogue generation has stopped."}), self.mission_id)
+            return False
+        await self.manager.send_to_client(json.dumps({"status": self.mission_status}), self.mission_id)
+        return True
+
     async def signal_ready_for_next(self):
         """Triggers the next action in the main loop if the session is idle."""
         pass # Main loop is now continuous, no need to trigger it here
@@ -101,6 +172,7 @@ class GameSession:
         async with self._state_lock:
             if self._state == SessionState.SPEAKING_TTS and self._tts_task:
                 self._tts_task.cancel()
+            self._cancel_generation()
             
             self._state = SessionState.LISTENING_TO_USER
             print("[GameSession] State changed to LISTENING_TO_USER")
@@ -126,6 +198,8 @@ class GameSession:
             if transcript:
                 print(f"[GameSession] Final transcript processed: '{transcript}'")
                 self.dialogue_history += f"\nUser: {transcript}"
+                self._has_new_user_input = True
+                self._next_generation_at = 0.0 # Answer the user now instead of waiting out a retry delay
             
             self._state = SessionState.IDLE
             print("[GameSession] State changed to IDLE")
@@ -142,6 +216,7 @@ class GameSession:
             if self._state == SessionState.SPEAKING_TTS and self._tts_task:
                 self._tts_task.cancel()
                 print("[GameSession] Cancelled running TTS task due to user dialogue.")
+            self._cancel_generation()
 
             # Clear any pending dialogue
             while not self.dialogue_queue.empty():
@@ -150,11 +225,68 @@ class GameSession:
 
             # Append user dialogue to history
             self.dialogue_history += f"\nUser: {dialogue}"
+            self._has_new_user_input = True
+            self._next_generation_at = 0.0 # Answer the user now instead of waiting out a retry delay
             
             # Set state to IDLE, the main loop will now generate new dialogue
             self._state = SessionState.IDLE
             print("[GameSession] State set to IDLE to trigger new dialogue generation.")
 
+    def _cancel_generation(self):
+        """Cancels any in-flight dialogue generation so stale lines are not queued."""
+        if self._generation_task and not self._generation_task.done():
+            self._generation_task.cancel()
+            print("[GameSession] Cancelled in-flight dialogue generation.")
+
+    async def _generate_dialogue_batch(self):
+        """
+        Streams the next dialogue turn into the queue, one line at a time, and applies
+        the turn's listener impact once the same response has completed.
+        """
+        responds_to_user = self._has_new_user_input
+        self._has_new_user_input = False
+        batch_size = 0
+        try:
+            async for item in generate_dialogue(
+                self.mission_context,
+                self.dialogue_history,
+                self.proof_sentences,
+                self.dialogue_cache_name,
+            ):
+                if isinstance(item, DialogueTurn):
+                    if responds_to_user:
+                        self._apply_awakening_change(item.awakened_listeners_change)
+                    continue
+                await self.dialogue_queue.put(item)
+                batch_size += 1
+            print(f"[GameSession] Generated dialogue batch size: {batch_size}")
+            self._generation_failures = 0
+        except DialogueCacheExpiredError as e:
+            # The cache outlived its TTL; continue with the uncached prompt.
+            print(f"[GameSession] {e}. Falling back to the full prompt per turn.")
+            self.dialogue_cache_name = None
+            self._restore_user_input_flag(responds_to_user, batch_size)
+        except LLMServiceError as e:
+            print(f"[GameSession] Failed to generate new dialogues: {e}")
+            self._generation_failures += 1
+            delay = min(GENERATION_RETRY_BASE_DELAY * 2 ** (self._generation_failures - 1), GENERATION_RETRY_MAX_DELAY)
+            self._next_generation_at = asyncio.get_running_loop().time() + delay
+            print(f"[GameSession] Retrying dialogue generation in {delay:.0f}s.")
+            self._restore_user_input_flag(responds_to_user, batch_size)
+
+    def _restore_user_input_flag(self, responds_to_user: bool, batch_size: int):
+        """
+        After a failed generation, lets the next attempt judge the user's input,
+        unless the hosts already answered it with lines from the failed turn.
+        """
+        if responds_to_user and batch_size == 0:
+            self._has_new_user_input = True
+
+    def _apply_awakening_change(self, change: float):
+        """Applies a percentage change (of the initial listeners) to the awakened listener count."""
+        self._awakened_listeners += self.initial_listeners * change / 100
+        print(f"[GameSession] Awakened listeners changed by {change}%")
+
     async def _stream_tts_for_line(self, dialogue_line: DialogueLine):
         """Streams TTS for a single line. This is a self-contained task."""
         try:
@@ -183,30 +315,26 @@ class GameSession:
     async def _main_loop(self):
         """
         The core logic loop. It continuously processes dialogue and manages TTS playback sequentially.
+        Lines are spoken as soon as they are streamed in, while the rest of the turn is still generating.
         """
         while self._is_active:
             if self._state == SessionState.IDLE:
                 if self.dialogue_queue.empty():
-                    # If idle and queue is empty, generate new dialogue.
-                    print("[GameSession] Dialogue queue empty. Generating new batch...")
-                    # Temporarily block state during generation.
-                    async with self._state_lock:
-                        self._state = SessionState.SPEAKING_TTS
-                    
-                    new_dialogues = await asyncio.to_thread(
-                        generate_dialogue, self.mission_context, self.dialogue_history, self.proof_sentences
-                    )
-                    
-                    if new_dialogues:
-                        print(f"[GameSession] Generated dialogue batch size: {len(new_dialogues)}")
-                        for dialogue in new_dialogues:
-                            await self.dialogue_queue.put(dialogue)
-                    else:
-                        print("[GameSession] Failed to generate new dialogues.")
-                    
-                    # Revert to IDLE to allow the loop to pick up the new dialogue.
-                    async with self._state_lock:
-                        self._state = SessionState.IDLE
+                    # If idle and queue is empty, generate new dialogue unless a
+                    # generation is already streaming lines into the queue.
+                    if self._generation_task is None or self._generation_task.done():
+                        if self._generation_failures >= MAX_GENERATION_FAILURES:
+                            print(f"[GameSession] Dialogue generation failed {self._generation_failures} times in a row. Closing session.")
+                            self._is_active = False
+                            await self.manager.send_to_client(
+                                json.dumps({"error": "Dialogue generation failed repeatedly."}), self.mission_id
+                            )
+                            # Closing the socket makes the endpoint stop and discard this session.
+                            await self.manager.close(self.mission_id)
+                            return
+                        if asyncio.get_running_loop().time() >= self._next_generation_at:
+                            print("[GameSession] Dialogue queue empty. Generating new batch...")
+                            self._generation_task = asyncio.create_task(self._generate_dialogue_batch())
                 else:
                     # If idle and queue has items, speak the next line.
                     async with self._state_lock:
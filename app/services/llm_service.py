@@ -1,8 +1,12 @@
-from typing import List
+import functools
+import json
+import re
+from typing import AsyncIterator, List
 from google import genai
-from google.genai import types
+from google.genai.client import AsyncClient
+from google.genai import errors, types
 from app.core.config import settings
-from app.schemas.propaganda import PropagandaGenerationResult, DialogueLine, DialogueTurn
+from app.schemas.propaganda import MAX_DIALOGUE_LINES, MissionGenerationResult, DialogueLine, DialogueTurn
 
 # --- Generic Prompt Templates ---
 
@@ -40,17 +44,29 @@ Based on the hacker's last statement, you must determine the percentage of liste
 - Provide this as a floating-point number in the `awakened_listeners_change` field.
 """
 
+DIALOGUE_MODEL = "gemini-2.5-flash-lite-preview-06-17"
+DIALOGUE_CACHE_TTL = "7200s" # Outlives a typical game session; the session deletes the cache when the client disconnects.
+
 class LLMServiceError(Exception):
     """Custom exception for LLM service errors."""
     pass
 
-def _get_genai_client():
-    """Initializes and returns a GenAI client."""
+class DialogueCacheExpiredError(LLMServiceError):
+    """Raised when the dialogue cache passed to `generate_dialogue` no longer exists."""
+    pass
+
+@functools.lru_cache(maxsize=1)
+def _client() -> genai.Client:
+    """Returns a process-wide GenAI client so its HTTP connection pool is reused."""
     return genai.Client(api_key=settings.GOOGLE_API_KEY)
 
-def generate_initial_propaganda(topic: str | None) -> PropagandaGenerationResult:
+def _aclient() -> AsyncClient:
+    """Returns the async interface of the shared GenAI client."""
+    return _client().aio
+
+async def generate_initial_propaganda(topic: str | None) -> MissionGenerationResult:
     """
-    Generates the initial propaganda content (Stage 1).
+    Generates the full mission content, including the character briefing, in a single call.
     If the topic is 'any' or None, it instructs the LLM to invent one.
     """
     topic_instruction = ""
@@ -80,81 +96,203 @@ def generate_initial_propaganda(topic: str | None) -> PropagandaGenerationResult
         "    - Create a list of 3-5 'Secret Key Points'. These are the **actual facts** of the story that contradict the propaganda narrative. \n"
         "    - These sentences are the ammunition for the hacker character. They should be specific, verifiable-sounding pieces of information that can be used to expose the hosts' lies.\n\n"
         "5.  **`initial_listeners`:**\n"
-        "    - Provide a realistic integer for the number of initial listeners (e.g., between 50,000 and 250,000)."
+        "    - Provide a realistic integer for the number of initial listeners (e.g., between 50,000 and 250,000).\n\n"
+        "6.  **`briefing` (The Show & Character Briefing):**\n"
+        "    - Based on the narrative and the speakers you created above, write a detailed 'Show & Character Briefing' for the dialogue generation AI.\n"
+        "    - It must define the personality, style, and unwavering pro-state perspective for EACH speaker. They are propagandists, not debaters. Their goal is to reinforce the narrative, not to explore other viewpoints.\n"
+        "    - This briefing will be used by another AI to generate their dialogue, so be specific and clear about their mission to manipulate the audience. It must never mention the 'Secret Key Points'."
     )
     try:
-        client = _get_genai_client()
         generate_content_config = types.GenerateContentConfig(
             response_mime_type="application/json",
-            response_schema=PropagandaGenerationResult,
+            response_schema=MissionGenerationResult,
         )
-        response = client.models.generate_content(
+        response = await _aclient().models.generate_content(
             model="gemini-2.0-flash",
             contents=[types.Part.from_text(text=prompt)],
             config=generate_content_config,
         )
-        if hasattr(response, 'parsed') and isinstance(response.parsed, PropagandaGenerationResult):
+        if hasattr(response, 'parsed') and isinstance(response.parsed, MissionGenerationResult):
             return response.parsed
-        raise LLMServiceError("LLM did not return a valid PropagandaGenerationResult object.")
+        raise LLMServiceError("LLM did not return a valid MissionGenerationResult object.")
     except Exception as e:
-        raise LLMServiceError(f"An unexpected error occurred during initial propaganda generation: {e}")
+        raise LLMServiceError(f"An unexpected error occurred during propaganda generation: {e}")
 
-def generate_unified_dialogue_prompt(mission_data: PropagandaGenerationResult, topic: str) -> str:
+def _dialogue_system_instruction() -> str:
+    """Returns the static rules shared by every dialogue turn."""
+    return f"{GENERIC_DIALOGUE_INSTRUCTIONS}\n\n{GENERIC_AWAKENING_INSTRUCTIONS}"
+
+def _mission_context_prompt(mission_context: str, proof_sentences: List[str]) -> str:
+    """Returns the per-mission part of the dialogue prompt, which stays fixed for a session."""
+    key_points = "\n".join(proof_sentences)
+    return f"Secret Key Points:\n{key_points}\n\n**Show & Character Briefing:**\n{mission_context}"
+
+async def create_dialogue_cache(mission_context: str, proof_sentences: List[str]) -> str:
     """
-    Generates the dynamic part of the unified dialogue prompt for Stage 2.
-    This includes character descriptions and background info.
+    Caches the static dialogue instructions and the mission context for a session.
+    Returns the cache name to pass to `generate_dialogue`, so the shared prefix is
+    only prefilled once per mission instead of on every turn.
     """
-    character_profiles = "\\n".join([f"- {s.name} ({s.gender}, {s.role}): {s.background}" for s in mission_data.speakers])
-
-    prompt = (
-        "You are a script director for a dystopian state-sponsored propaganda radio show. Your task is to create the detailed character briefings for the dialogue generation AI. The show's entire purpose is to push a specific, state-approved narrative.\n\n"
-        f"**Show's Propaganda Narrative:** \"{mission_data.summary}\"\n\n"
-        "**The Characters (Propagandists):**\n"
-        f"{character_profiles}\n\n"
-        "**Your Task:**\n"
-        "Based on the show's narrative and the character roles, write a detailed 'Show & Character Briefing'. This briefing must define the personality, style, and unwavering pro-state perspective for EACH character. They are propagandists, not debaters. Their goal is to reinforce the narrative, not to explore other viewpoints. This briefing will be used by another AI to generate their dialogue, so be specific and clear about their mission to manipulate the audience."
-    )
     try:
-        client = _get_genai_client()
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=[types.Part.from_text(text=prompt)],
+        cache = await _aclient().caches.create(
+            model=DIALOGUE_MODEL,
+            config=types.CreateCachedContentConfig(
+                system_instruction=_dialogue_system_instruction(),
+                contents=[
+                    types.Content(
+                        role="user",
+                        parts=[types.Part.from_text(text=_mission_context_prompt(mission_context, proof_sentences))],
+                    )
+                ],
+                ttl=DIALOGUE_CACHE_TTL,
+            ),
         )
-        if response.text:
-            return response.text
-        raise LLMServiceError("LLM returned an empty response for the unified dialogue prompt.")
+        if cache.name:
+            return cache.name
+        raise LLMServiceError("LLM did not return a name for the dialogue cache.")
+    except Exception as e:
+        raise LLMServiceError(f"An unexpected error occurred during dialogue cache creation: {e}")
+
+async def delete_dialogue_cache(cache_name: str) -> None:
+    """Deletes a dialogue cache created by `create_dialogue_cache`."""
+    try:
+        await _aclient().caches.delete(name=cache_name)
     except Exception as e:
-        raise LLMServiceError(f"An unexpected error occurred during unified prompt generation: {e}")
+        raise LLMServiceError(f"An unexpected error occurred during dialogue cache deletion: {e}")
+
+class _DialogueStreamParser:
+    """
+    Pulls complete dialogue lines out of a partially streamed DialogueTurn JSON
+    document, so each line can be used before the whole turn has been generated.
+
+    Mid-stream buffers are never handed to the JSON parser: a bracket-depth scan
+    (aware of strings and escapes) finds where each object in the dialogues array
+    ends, and only those complete objects are parsed. The full document is parsed
+    once, in `finish`, after the stream has completed. Lines beyond
+    MAX_DIALOGUE_LINES are dropped, so an over-long turn is never spoken in full.
+    """
+    _DIALOGUES_START = re.compile(r'"dialogues"\s*:\s*\[')
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos: int | None = None # Scan position inside the dialogues array
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._object_start = 0
+        self._array_closed = False
+        self._line_count = 0
+
+    def feed(self, text: str) -> List[DialogueLine]:
+        """Adds a streamed chunk and returns any dialogue lines it completed."""
+        self._buffer += text
+        lines: List[DialogueLine] = []
+        if self._pos is None:
+            match = self._DIALOGUES_START.search(self._buffer)
+            if not match:
+                return lines
+            self._pos = match.end()
 
-def generate_dialogue(mission_context: str, dialogue_history: str, proof_sentences: List[str]) -> List[DialogueLine]:
+        buffer = self._buffer
+        while not self._array_closed and self._pos < len(buffer):
+            char = buffer[self._pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    self._object_start = self._pos
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    lines.append(DialogueLine.model_validate_json(buffer[self._object_start:self._pos + 1]))
+                    self._line_count += 1
+                    if self._line_count >= MAX_DIALOGUE_LINES:
+                        self._array_closed = True
+            elif char == "]" and self._depth == 0:
+                self._array_closed = True
+            self._pos += 1
+        return lines
+
+    def finish(self) -> DialogueTurn:
+        """
+        Parses the complete document, keeping only the lines `feed` returned.
+        Only call this once the stream has finished.
+        """
+        data = json.loads(self._buffer)
+        if isinstance(data, dict) and isinstance(data.get("dialogues"), list):
+            data["dialogues"] = data["dialogues"][:MAX_DIALOGUE_LINES]
+        return DialogueTurn.model_validate(data)
+
+async def generate_dialogue(
+    mission_context: str,
+    dialogue_history: str,
+    proof_sentences: List[str],
+    cache_name: str | None = None,
+) -> AsyncIterator[DialogueLine | DialogueTurn]:
     """
-    Generates the next lines of dialogue for the hosts as a structured object.
+    Streams the next lines of dialogue for the hosts, yielding each line as soon
+    as it has been generated. Once the stream completes, the validated DialogueTurn
+    (including `awakened_listeners_change`) is yielded as the final item, so a turn
+    needs exactly one LLM call.
+    If `cache_name` is given, the static instructions and mission context are read
+    from that cache and only the conversation so far is sent.
     """
     prompt = (
-        f"{GENERIC_DIALOGUE_INSTRUCTIONS}\n\n"
-        f"Secret Key Points:\n"
-        f"{'\\n'.join(proof_sentences)}\n\n"
-        f"{GENERIC_AWAKENING_INSTRUCTIONS}\n\n"
-        "**Show & Character Briefing:**\n"
-        f"{mission_context}\n\n"
         "**Previous Conversation:**\n"
         f"{dialogue_history}\n\n"
         "**Your Task:**\n"
         "Based on all the information above, generate the next turn of the conversation. The output must be a valid JSON object matching the required schema. The conversation should flow naturally."
     )
     try:
-        client = _get_genai_client()
-        generate_content_config = types.GenerateContentConfig(
-            response_mime_type="application/json",
-            response_schema=DialogueTurn,
-        )
-        response = client.models.generate_content(
-            model="gemini-2.5-flash-lite-preview-06-17",
-            contents=[types.Part.from_text(text=prompt)],
+        if cache_name:
+            generate_content_config = types.GenerateContentConfig(
+                cached_content=cache_name,
+                response_mime_type="application/json",
+                response_schema=DialogueTurn,
+            )
+            contents = [types.Part.from_text(text=prompt)]
+        else:
+            generate_content_config = types.GenerateContentConfig(
+                system_instruction=_dialogue_system_instruction(),
+                response_mime_type="application/json",
+                response_schema=DialogueTurn,
+            )
+            contents = [
+                types.Part.from_text(text=_mission_context_prompt(mission_context, proof_sentences)),
+                types.Part.from_text(text=prompt),
+            ]
+        stream = await _aclient().models.generate_content_stream(
+            model=DIALOGUE_MODEL,
+            contents=contents,
             config=generate_content_config,
         )
-        if hasattr(response, 'parsed') and isinstance(response.parsed, DialogueTurn):
-            return response.parsed.dialogues
-        raise LLMServiceError("LLM did not return a valid DialogueTurn object.")
+        parser = _DialogueStreamParser()
+        finish_reason = None
+        async for chunk in stream:
+            if chunk.candidates and chunk.candidates[0].finish_reason:
+                finish_reason = chunk.candidates[0].finish_reason
+            if not chunk.text:
+                continue
+            for line in parser.feed(chunk.text):
+                yield line
+        if finish_reason != types.FinishReason.STOP:
+            # The buffer may end mid-object (e.g. MAX_TOKENS), so it must not be parsed.
+            raise LLMServiceError(f"Dialogue stream ended before the turn was complete (finish reason: {finish_reason}).")
+        yield parser.finish()
+    except LLMServiceError:
+        raise
+    except errors.ClientError as e:
+        # An expired or deleted cache is reported as not found / permission denied.
+        if cache_name and e.code in (403, 404):
+            raise DialogueCacheExpiredError(f"Dialogue cache {cache_name} is no longer available: {e}")
+        raise LLMServiceError(f"An unexpected error occurred during dialogue generation: {e}")
     except Exception as e:
         raise LLMServiceError(f"An unexpected error occurred during dialogue generation: {e}")
@@ -7,60 +7,97 @@ import websockets
 import aiohttp
 import queue
 import threading
+import contextvars
 import sounddevice as sd
-import numpy as np
 
 # --- Configuration ---
 BASE_URL = "http://localhost:8000/api/v1"
 TTS_SAMPLE_RATE = 24000  # Deepgram's Aura TTS output sample rate
 CHANNELS = 1
+PLAYER_POLL_TIMEOUT = 0.5  # Seconds the player waits for audio before re-checking for shutdown
 
-# --- Global State ---
-mission_data_storage = {}
+# --- Session State ---
+current_mission: contextvars.ContextVar[dict | None] = contextvars.ContextVar("current_mission", default=None)
+stdin_lines: contextvars.ContextVar[asyncio.Queue] = contextvars.ContextVar("stdin_lines")  # Set by main()
 
 def pretty_print_json(data):
     """Prints JSON data in a readable format."""
     print(json.dumps(data, indent=4))
 
+# --- Console Input ---
+def _stdin_reader(loop: asyncio.AbstractEventLoop, lines: asyncio.Queue):
+    """
+    Reads stdin on a daemon thread and hands each line to the event loop. Unlike
+    `asyncio.to_thread(input)`, a pending read never keeps the interpreter from exiting.
+    """
+    while True:
+        line = sys.stdin.readline()
+        try:
+            loop.call_soon_threadsafe(lines.put_nowait, line)
+        except RuntimeError:
+            break  # The event loop has been closed
+        if not line:
+            break  # EOF
+
+def start_stdin_reader() -> asyncio.Queue:
+    """Starts the stdin reader thread and returns the queue it fills with lines."""
+    lines: asyncio.Queue = asyncio.Queue()
+    threading.Thread(
+        target=_stdin_reader, args=(asyncio.get_running_loop(), lines), daemon=True
+    ).start()
+    return lines
+
+async def ainput(prompt: str) -> str:
+    """An `input()` replacement that waits on the event loop instead of blocking it."""
+    lines = stdin_lines.get()
+    print(prompt, end="", flush=True)
+    line = await lines.get()
+    if not line:
+        lines.put_nowait(line)  # Keep reporting EOF to later callers
+        raise EOFError
+    return line.rstrip("\n")
+
 # --- Audio Playback Thread ---
-def audio_player_thread(audio_q: queue.Queue):
+def audio_player_thread(audio_q: queue.Queue, stop_event: threading.Event):
     """
-    A dedicated thread for playing audio from a queue. It buffers incoming byte chunks
-    to ensure that only complete audio samples (multiples of 2 bytes for int16) are played.
+    A dedicated thread for playing audio from a queue. It plays until it receives a
+    `None` sentinel, or until `stop_event` is set for an immediate shutdown.
+    It ensures that only complete audio samples (multiples of 2 bytes for int16) are
+    played. Each chunk is written straight to a raw output stream through a zero-copy
+    view; only an odd trailing byte is carried over to the next chunk.
     """
-    stream = sd.OutputStream(samplerate=TTS_SAMPLE_RATE, channels=CHANNELS, dtype='int16')
+    stream = sd.RawOutputStream(samplerate=TTS_SAMPLE_RATE, channels=CHANNELS, dtype='int16')
     stream.start()
-    audio_buffer = bytearray()
+    carry = b""  # At most one byte: the first half of a sample split across chunks
     
-    while True:
-        chunk = audio_q.get()
+    while not stop_event.is_set():
+        try:
+            chunk = audio_q.get(timeout=PLAYER_POLL_TIMEOUT)
+        except queue.Empty:
+            continue
         if chunk is None:
             break
-            
-        audio_buffer.extend(chunk)
+
+        if carry:
+            chunk = carry + chunk
         
-        # Process and play audio in chunks that are a multiple of the sample size (2 bytes for int16)
-        playable_size = (len(audio_buffer) // 2) * 2
+        # Play the part of the chunk that is a multiple of the sample size (2 bytes for int16)
+        playable_size = len(chunk) & ~1
+        view = memoryview(chunk)
         
         if playable_size > 0:
-            data_to_play = audio_buffer[:playable_size]
             try:
-                audio_chunk_np = np.frombuffer(data_to_play, dtype=np.int16)
-                stream.write(audio_chunk_np)
+                stream.write(view[:playable_size])
             except Exception as e:
                 print(f"[PLAYER-ERROR] Could not play audio chunk: {e}")
             
-            # Keep the remainder in the buffer
-            audio_buffer = audio_buffer[playable_size:]
-
-    # Play any remaining audio in the buffer after the loop finishes
-    if len(audio_buffer) > 0:
-        # Pad with a zero byte if the buffer has an odd number of bytes
-        if len(audio_buffer) % 2 != 0:
-            audio_buffer.append(0)
+        # Keep the remainder for the next chunk
+        carry = bytes(view[playable_size:])
+
+    # Play any remaining byte after the loop finishes, padded to a full sample
+    if carry:
         try:
-            final_chunk = np.frombuffer(audio_buffer, dtype=np.int16)
-            stream.write(final_chunk)
+            stream.write(carry + b"\x00")
         except Exception as e:
             print(f"[PLAYER-ERROR] Could not play final audio buffer: {e}")
             
@@ -71,8 +108,8 @@ def audio_player_thread(audio_q: queue.Queue):
 # --- Core Application Logic ---
 async def create_mission(session: aiohttp.ClientSession):
     """Calls the create_mission endpoint."""
-    topic = input("Enter the mission topic: ")
-    user_id = input("Enter your user ID: ")
+    topic = await ainput("Enter the mission topic: ")
+    user_id = await ainput("Enter your user ID: ")
     print("\nCreating mission...")
     try:
         async with session.post(
@@ -81,7 +118,7 @@ async def create_mission(session: aiohttp.ClientSession):
             response.raise_for_status()
             mission_data = await response.json()
             if mission_id := str(mission_data.get("_id")):
-                mission_data_storage['current_mission'] = mission_data
+                current_mission.set(mission_data)
                 print("Mission created successfully!")
                 # pretty_print_json(mission_data) # Removed verbose logging
             else:
@@ -89,29 +126,13 @@ async def create_mission(session: aiohttp.ClientSession):
     except aiohttp.ClientError as e:
         print(f"An error occurred: {e}")
 
-async def poll_mission_status(session: aiohttp.ClientSession, mission_id: str):
-    """Polls until the mission is ready (stage2)."""
-    print(f"\nPolling status for mission: {mission_id}")
-    while True:
-        try:
-            async with session.get(f"{BASE_URL}/mission_status/{mission_id}") as response:
-                response.raise_for_status()
-                status_data = await response.json()
-                current_status = status_data.get("status")
-                print(f"Current status: {current_status}")
-                if current_status == "stage2":
-                    print("Stage 2 reached! Connecting to WebSocket...")
-                    return True
-                await asyncio.sleep(2)
-        except aiohttp.ClientError as e:
-            print(f"An error occurred while polling: {e}")
-            return False
-
 async def handle_websocket_communication(uri: str):
     """Manages the entire WebSocket lifecycle including audio I/O and text input."""
     audio_output_q = queue.Queue()
-    player = threading.Thread(target=audio_player_thread, args=(audio_output_q,))
-    player.start()
+    stop_player = threading.Event()
+    player = asyncio.get_running_loop().run_in_executor(
+        None, audio_player_thread, audio_output_q, stop_player
+    )
     
     try:
         async with websockets.connect(uri) as websocket:
@@ -120,7 +141,7 @@ async def handle_websocket_communication(uri: str):
             # Task to send user text input to the server
             async def text_sender():
                 while True:
-                    user_input = await asyncio.to_thread(input, "You: ")
+                    user_input = await ainput("You: ")
                     if user_input.lower() == "exit":
                         break
                     await websocket.send(json.dumps({"user_dialogue": user_input}))
@@ -134,7 +155,11 @@ async def handle_websocket_communication(uri: str):
                             audio_output_q.put(message)
                         elif isinstance(message, str):
                             data = json.loads(message)
-                            if "awakened_listeners" in data:
+                            if "status" in data:
+                                print(f"[STATUS] Mission status: {data['status']}")
+                            elif "error" in data:
+                                print(f"\n[ERROR] {data['error']}")
+                            elif "awakened_listeners" in data:
                                 print(f"[LISTENERS] Awakened: {data['awakened_listeners']}", end='\r')
                             # Removed dialogue_end and ready_for_next handling
                     except websockets.exceptions.ConnectionClosed:
@@ -146,17 +171,24 @@ async def handle_websocket_communication(uri: str):
             
             await asyncio.gather(sender_task, receiver_task)
 
+    except asyncio.CancelledError:
+        # Ctrl-C: stop the player right away instead of playing out the queued audio.
+        stop_player.set()
+        raise
     except Exception as e:
         print(f"\n[ERROR] An unexpected error occurred: {e}")
     finally:
         audio_output_q.put(None)
-        player.join()
+        # Wait for the player without blocking the event loop; on a normal exit it
+        # drains the queued audio first, after Ctrl-C it stops within PLAYER_POLL_TIMEOUT.
+        await player
         print("[INFO] Client shutdown complete.")
 
 async def main():
     """Main function to run the test script."""
     print("NOTE: This script requires 'sounddevice', 'numpy', and 'aiohttp'.")
     print("Install them with: pip install sounddevice numpy aiohttp")
+    stdin_lines.set(start_stdin_reader())
     
     async with aiohttp.ClientSession() as session:
         while True:
@@ -166,20 +198,20 @@ async def main():
             print("3. Connect to an existing mission by ID")
             print("4. Exit")
             
-            choice = input("Enter your choice: ")
+            choice = await ainput("Enter your choice: ")
             
             mission_id = None
             if choice == '1':
                 await create_mission(session)
-                if 'current_mission' in mission_data_storage:
-                    mission_id = str(mission_data_storage['current_mission'].get("_id"))
+                if mission := current_mission.get():
+                    mission_id = str(mission.get("_id"))
             elif choice == '2':
-                if 'current_mission' in mission_data_storage:
-                    mission_id = mission_data_storage['current_mission'].get("id")
+                if mission := current_mission.get():
+                    mission_id = str(mission.get("_id"))
                 else:
                     print("No mission created yet.")
             elif choice == '3':
-                mission_id = input("Enter the existing mission ID: ")
+                mission_id = await ainput("Enter the existing mission ID: ")
                 # Ensure the entered ID is treated as a string
                 mission_id = str(mission_id)
             elif choice == '4':
@@ -189,9 +221,9 @@ async def main():
                 continue
 
             if mission_id:
-                if await poll_mission_status(session, mission_id):
-                    uri = f"ws://localhost:8000/api/v1/ws/{mission_id}"
-                    await handle_websocket_communication(uri)
+                # The server pushes the mission status once the WebSocket is open.
+                uri = f"ws://localhost:8000/api/v1/ws/{mission_id}"
+                await handle_websocket_communication(uri)
 
 if __name__ == "__main__":
     try: